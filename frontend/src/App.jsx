@@ -19,7 +19,7 @@ function App() {
     try {
       setError('');
       const response = await axios.get(`${API_URL}/conversations`);
-      setConversations(response.data);
+      setConversations(response.data.items);
     } catch (err) {
       console.error("Failed to fetch conversations:", err);
       setError("Could not load conversation history. Is the backend running?");
@@ -1,33 +1,55 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
 from typing import List, Optional
+from collections import OrderedDict
+import asyncio
 import datetime
+import hashlib
+import orjson
+import multiprocessing
+import random
+import socket
+import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+import httpx
 
 # Firebase Admin SDK for database interaction
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
 
 # --- Your Existing Logic ---
-from newspaper import Article
-from serpapi import GoogleSearch
+from parsing import parse_html
+from async_lru import alru_cache
+import diskcache
+import redis.asyncio as redis
 
 # --- SETUP ---
 load_dotenv()
 
+# Number of uvicorn worker processes serving this app (set by serve.py, or by hand when using --workers)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+QUERY_CACHE_TTL_SECONDS = 86400  # Cached answers older than this are researched again
+
 # Global variables to track service availability
 db = None
 google_api_key = None
 serpapi_api_key = None
+semantic_cache = None
+embedder = None
+redis_client = None
 services_initialized = False
 
 def initialize_services():
     """Initialize all external services (Firebase, Google AI, etc.)"""
-    global db, google_api_key, serpapi_api_key, services_initialized
+    global db, google_api_key, serpapi_api_key, semantic_cache, embedder, redis_client, services_initialized
     
     missing_services = []
     
@@ -39,7 +61,7 @@ def initialize_services():
             cred = credentials.Certificate("firebase-credentials.json")
             if not firebase_admin._apps:
                 firebase_admin.initialize_app(cred)
-            db = firestore.client()
+            db = firestore_async.client()
             print("✓ Firebase initialized successfully")
     except Exception as e:
         missing_services.append(f"Firebase (Error: {e})")
@@ -60,6 +82,35 @@ def initialize_services():
             print("✓ Google Generative AI initialized successfully")
         except Exception as e:
             missing_services.append(f"Google Generative AI (Error: {e})")
+
+    # Initialize Redis (optional, shares caches and in-flight work across workers and replicas)
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        try:
+            redis_client = redis.Redis.from_url(redis_url)
+            print("✓ Redis initialized successfully")
+        except Exception as e:
+            print(f"⚠️  Redis disabled, caches stay per-process (Error: {e})")
+
+    # Initialize the semantic response cache (optional, only speeds up repeated queries)
+    if db and WEB_CONCURRENCY > 1 and not redis_client:
+        # The FAISS index is a per-process file; several workers would overwrite each other's copy
+        print("⚠️  Semantic cache disabled: multiple workers need REDIS_URL to share it")
+    elif db:
+        try:
+            from semantic_cache import SemanticCache, load_embedder
+            # Loaded once per process and shared by every semantic-cache lookup
+            embedder = load_embedder()
+            semantic_cache = SemanticCache(
+                index_path=os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.faiss"),
+                embedder=embedder,
+                score_threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.90")),
+                redis_client=redis_client,
+                redis_ttl_seconds=QUERY_CACHE_TTL_SECONDS,
+            )
+            print("✓ Semantic cache initialized successfully")
+        except Exception as e:
+            print(f"⚠️  Semantic cache disabled (Error: {e})")
     
     if missing_services:
         print("⚠️  WARNING: Some services could not be initialized:")
@@ -100,12 +151,144 @@ class ConversationMeta(BaseModel):
     id: str
     title: str
 
+class ConversationPage(BaseModel):
+    items: List[ConversationMeta]
+    next_cursor: Optional[str] = None  # createdAt of the last item, pass back as `cursor` for the next page
+
 # --- FastAPI App ---
 app = FastAPI(title="Perplexity-Style AI Research API")
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
+SERPAPI_SEARCH_URL = "https://serpapi.com/search.json"
+SERP_DISK_CACHE_TTL_SECONDS = 86400
+SINGLE_FLIGHT_LOCK_SECONDS = 60
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+PERSIST_RETRY_QUEUE = "persist_retry"
+PERSIST_RETRY_INTERVAL_SECONDS = 60
+serp_disk_cache = diskcache.Cache(os.getenv("SERP_CACHE_DIR", ".serp_cache"))
+
+SCRAPE_CONCURRENCY = 10
+SCRAPE_REQUESTS_PER_SECOND = 5  # Per target host, across all workers
+SCRAPE_MAX_ATTEMPTS = 3
+SCRAPE_TOTAL_TIMEOUT_SECONDS = 15
+SCRAPE_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+SCRAPE_MAX_BYTES = 512_000  # Pages are truncated here so one huge page can't dominate latency or memory
+ROBOTS_TIMEOUT = httpx.Timeout(5.0)
+ROBOTS_MAX_BYTES = 512_000  # Anything past this is ignored, as Google does
+ROBOTS_CACHE_SECONDS = 3600
+ROBOTS_FAILURE_CACHE_SECONDS = 300  # A host whose robots.txt couldn't be read is retried sooner
+MAX_TRACKED_HOSTS = 1024  # Bounds the per-host rate limiter and robots.txt caches
+MAX_CONTENT_TOKENS = 12000
+MIN_SOURCE_CHARS = 500  # A source that would be cut shorter than this to fit the budget is left out entirely
+# Parse processes per uvicorn worker, so the whole server uses about one per core
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)))
+SCRAPER_USER_AGENT = "Mozilla/5.0 (compatible; AIResearchAgent/1.0)"
+# robotparser matches User-agent lines against the text before the first "/", so it needs the bare product token
+ROBOTS_USER_AGENT = "AIResearchAgent"
+
+@app.on_event("startup")
+async def open_http_client():
+    """Creates one pooled HTTP client so keep-alive connections and TLS sessions are reused across requests."""
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        headers={"User-Agent": SCRAPER_USER_AGENT},
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        timeout=httpx.Timeout(10.0, connect=5.0),
+    )
+    # Shared by every request, so the limit bounds concurrent fetches across the whole worker
+    app.state.scrape_semaphore = asyncio.Semaphore(SCRAPE_CONCURRENCY)
+
+@app.on_event("startup")
+async def open_parse_pool():
+    """Creates a process pool so CPU-bound HTML parsing runs on all cores instead of under one GIL.
+
+    Workers are spawned rather than forked: by the first parse this process already runs gRPC, ONNX Runtime
+    and helper threads, which are not fork-safe. Spawned workers only import the lightweight parsing module.
+    """
+    app.state.pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await app.state.http.aclose()
+
+@app.on_event("startup")
+async def start_persist_retries():
+    """Starts the loop that re-saves conversations whose background Firestore write failed."""
+    app.state.persist_retries = asyncio.create_task(drain_persist_retries()) if redis_client else None
+
+@app.on_event("shutdown")
+async def close_parse_pool():
+    app.state.pool.shutdown(wait=False, cancel_futures=True)
+
+@app.on_event("shutdown")
+async def flush_semantic_cache():
+    if semantic_cache:
+        await semantic_cache.flush()
+
+@app.on_event("shutdown")
+async def stop_persist_retries():
+    if app.state.persist_retries:
+        app.state.persist_retries.cancel()
+
 # --- Helper Functions ---
-def search_the_web(query: str) -> List[str]:
+SUMMARY_ERROR_MESSAGE = "Failed to generate summary due to an AI model error."
+SUMMARY_MODEL_NAME = "gemini-1.5-flash"
+SUMMARY_INSTRUCTIONS = """
+Based on the following web content, provide a clear and comprehensive answer to the user's query.
+Instructions:
+1. First, provide a direct, concise summary that immediately answers the user's question.
+2. Then, create a section with bullet points detailing the most important findings, facts, or key takeaways.
+3. Use Markdown for formatting (e.g., **bold**, *italics*, bullet points).
+"""
+summary_model = None
+
+async def run_serpapi_search(query: str) -> List[str]:
+    params = {"q": query, "api_key": serpapi_api_key, "num": 5, "engine": "google"}
+    response = await app.state.http.get(SERPAPI_SEARCH_URL, params=params)
+    if response.is_error:
+        # Not raise_for_status(): its message includes the request URL, and with it the api_key
+        raise RuntimeError(f"SerpAPI request failed with HTTP {response.status_code}")
+    results = response.json()
+    # SerpAPI reports problems (including temporarily empty result pages) in an "error" field of a 200 response
+    if results.get("error"):
+        raise RuntimeError(f"SerpAPI error: {results['error']}")
+    return [result['link'] for result in results.get('organic_results', [])]
+
+async def get_shared_search(normalized_query: str) -> Optional[List[str]]:
+    if not redis_client:
+        return serp_disk_cache.get(normalized_query)
+    try:
+        cached = await redis_client.get(f"serp:{normalized_query}")
+        return orjson.loads(cached) if cached else None
+    except redis.RedisError as e:
+        print(f"Warning: Redis search cache unavailable: {e}")
+        return None
+
+async def set_shared_search(normalized_query: str, urls: List[str]):
+    if not redis_client:
+        serp_disk_cache.set(normalized_query, urls, expire=SERP_DISK_CACHE_TTL_SECONDS)
+        return
+    try:
+        await redis_client.set(f"serp:{normalized_query}", orjson.dumps(urls), ex=SERP_DISK_CACHE_TTL_SECONDS)
+    except redis.RedisError as e:
+        print(f"Warning: Redis search cache unavailable: {e}")
+
+@alru_cache(maxsize=1024, ttl=3600)
+async def cached_web_search(normalized_query: str) -> List[str]:
+    """SerpAPI lookup memoized in memory and in Redis (or on disk); errors and empty results propagate as exceptions so they are never cached."""
+    urls = await get_shared_search(normalized_query)
+    if urls:
+        return urls
+    urls = await run_serpapi_search(normalized_query)
+    if not urls:
+        # Raised rather than returned so an empty result, which is often transient, is not memoized
+        raise RuntimeError("SerpAPI returned no results")
+    await set_shared_search(normalized_query, urls)
+    return urls
+
+async def search_the_web(query: str) -> List[str]:
     print(f"Searching for: {query}...")
     if not serpapi_api_key:
         print("SerpAPI key not available - returning demo URLs")
@@ -115,16 +298,191 @@ def search_the_web(query: str) -> List[str]:
             "https://www.example.com"
         ]
     try:
-        params = {"q": query, "api_key": serpapi_api_key, "num": 5, "engine": "google"}
-        search = GoogleSearch(params)
-        results = search.get_dict()
-        urls = [result['link'] for result in results.get('organic_results', [])]
-        return urls
+        return await cached_web_search(query.strip().lower())
+    except httpx.HTTPError as e:
+        # httpx errors can carry the request URL, so only the type is logged
+        print(f"Error during web search: {type(e).__name__}")
+        return []
     except Exception as e:
         print(f"Error during web search: {e}")
         return []
 
-def scrape_and_process_urls(urls: List[str]) -> (str, List[Source]):
+class RateLimiter:
+    """Token bucket that smooths outbound requests to a single host."""
+
+    def __init__(self, requests_per_second: float):
+        self.rate = requests_per_second
+        # At least one token, so rates below 1/s still let a request through
+        self.capacity = max(1.0, requests_per_second)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class RedisRateLimiter:
+    """Per-host limit shared by every worker and replica: a one-second fixed window counted in Redis.
+
+    Falls back to a local token bucket, holding this worker's share of the rate, if Redis is unavailable.
+    """
+
+    def __init__(self, host: str, requests_per_second: int):
+        self.host = host
+        self.rate = requests_per_second
+        self.fallback = RateLimiter(requests_per_second / WEB_CONCURRENCY)
+
+    async def acquire(self):
+        while True:
+            now = time.time()
+            window = int(now)
+            try:
+                async with redis_client.pipeline(transaction=True) as pipe:
+                    pipe.incr(f"rate:{self.host}:{window}")
+                    pipe.expire(f"rate:{self.host}:{window}", 2)
+                    count, _ = await pipe.execute()
+            except redis.RedisError as e:
+                print(f"Warning: Redis rate limiter unavailable, limiting locally: {e}")
+                await self.fallback.acquire()
+                return
+            if count <= self.rate:
+                return
+            # Window is full: retry just after it rolls over, jittered so waiters don't stampede
+            await asyncio.sleep(window + 1 - now + random.random() * 0.1)
+
+host_rate_limiters: OrderedDict = OrderedDict()
+
+def remember_host(cache: OrderedDict, key: str, value) -> None:
+    """Stores a per-host entry, evicting the least recently used host beyond MAX_TRACKED_HOSTS."""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > MAX_TRACKED_HOSTS:
+        cache.popitem(last=False)
+
+def get_rate_limiter(url: str):
+    host = urlparse(url).netloc
+    if host in host_rate_limiters:
+        host_rate_limiters.move_to_end(host)
+    else:
+        if redis_client:
+            limiter = RedisRateLimiter(host, SCRAPE_REQUESTS_PER_SECOND)
+        else:
+            # Without shared state each worker gets an equal share, so one server still honours the per-host rate
+            limiter = RateLimiter(SCRAPE_REQUESTS_PER_SECOND / WEB_CONCURRENCY)
+        remember_host(host_rate_limiters, host, limiter)
+    return host_rate_limiters[host]
+
+robots_parsers: OrderedDict = OrderedDict()  # origin -> (parser, expires_at)
+robots_fetches: dict = {}  # origin -> in-flight fetch, so concurrent URLs on one host share it
+
+async def fetch_robots(client: httpx.AsyncClient, origin: str) -> (RobotFileParser, float):
+    """Fetches and parses robots.txt the way urllib.robotparser does, returning the parser and how long to keep it."""
+    parser = RobotFileParser()
+    try:
+        async with client.stream("GET", f"{origin}/robots.txt", timeout=ROBOTS_TIMEOUT) as response:
+            if response.status_code in (401, 403):
+                parser.disallow_all = True
+            elif 400 <= response.status_code < 500:
+                parser.allow_all = True
+            elif response.status_code >= 500:
+                parser.disallow_all = True
+                return parser, ROBOTS_FAILURE_CACHE_SECONDS
+            else:
+                body = b""
+                async for chunk in response.aiter_bytes(65536):
+                    body += chunk
+                    if len(body) >= ROBOTS_MAX_BYTES:
+                        break
+                parser.parse(body[:ROBOTS_MAX_BYTES].decode("utf-8", errors="replace").splitlines())
+    except httpx.HTTPError:
+        # Unreachable: stay off the host for now, but ask again soon
+        parser.disallow_all = True
+        return parser, ROBOTS_FAILURE_CACHE_SECONDS
+    return parser, ROBOTS_CACHE_SECONDS
+
+async def allowed_by_robots(client: httpx.AsyncClient, url: str) -> bool:
+    """Checks the host's robots.txt, cached per host for ROBOTS_CACHE_SECONDS.
+
+    A missing file allows everything; 401/403, server errors and network failures disallow everything,
+    the latter two only for ROBOTS_FAILURE_CACHE_SECONDS.
+    """
+    parsed = urlparse(url)
+    origin = f"{parsed.scheme}://{parsed.netloc}"
+    cached = robots_parsers.get(origin)
+    if cached and cached[1] > time.monotonic():
+        robots_parsers.move_to_end(origin)
+        parser = cached[0]
+    else:
+        fetch = robots_fetches.get(origin)
+        if fetch is None:
+            fetch = robots_fetches[origin] = asyncio.ensure_future(fetch_robots(client, origin))
+            try:
+                parser, ttl = await asyncio.shield(fetch)
+            finally:
+                del robots_fetches[origin]
+            remember_host(robots_parsers, origin, (parser, time.monotonic() + ttl))
+        else:
+            parser, _ = await asyncio.shield(fetch)
+    return parser.can_fetch(ROBOTS_USER_AGENT, url)
+
+async def download_html(client: httpx.AsyncClient, url: str, can_retry: bool) -> (int, Optional[str]):
+    """Streams at most SCRAPE_MAX_BYTES of a page, returning (status_code, html).
+
+    html is None when the response is not HTML, or when it failed with a status worth retrying.
+    """
+    headers = {"Range": f"bytes=0-{SCRAPE_MAX_BYTES - 1}"}
+    async with client.stream("GET", url, headers=headers, timeout=SCRAPE_TIMEOUT) as response:
+        if can_retry and response.status_code in RETRYABLE_STATUS_CODES:
+            return response.status_code, None
+        response.raise_for_status()
+        if "text/html" not in response.headers.get("content-type", ""):
+            return response.status_code, None
+
+        chunks = []
+        total = 0
+        async for chunk in response.aiter_bytes(65536):
+            chunks.append(chunk)
+            total += len(chunk)
+            if total >= SCRAPE_MAX_BYTES:
+                break
+        body = b"".join(chunks)[:SCRAPE_MAX_BYTES]
+        return response.status_code, body.decode(response.encoding or "utf-8", errors="replace")
+
+async def fetch_html(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, url: str) -> Optional[str]:
+    """Downloads a single HTML page, rate limited per host and retried with backoff on 429/5xx.
+
+    Returns None when robots.txt disallows the URL or the response is not HTML.
+    """
+    if not await allowed_by_robots(client, url):
+        print(f"Skipping {url}: disallowed by robots.txt")
+        return None
+
+    limiter = get_rate_limiter(url)
+    for attempt in range(SCRAPE_MAX_ATTEMPTS):
+        can_retry = attempt < SCRAPE_MAX_ATTEMPTS - 1
+        await limiter.acquire()
+        async with semaphore:
+            # Hard cap per request so one hung connection cannot hold a slot forever
+            status_code, html = await asyncio.wait_for(download_html(client, url, can_retry), SCRAPE_TOTAL_TIMEOUT_SECONDS)
+        if can_retry and status_code in RETRYABLE_STATUS_CODES:
+            await asyncio.sleep(2 ** attempt + random.random())
+            continue
+        if html is None:
+            print(f"Skipping {url}: not an HTML page")
+        return html
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+async def scrape_and_process_urls(urls: List[str], query: str) -> (str, List[Source]):
     print("Scraping URLs...")
     combined_content = ""
     sources_data = []
@@ -152,25 +510,50 @@ def scrape_and_process_urls(urls: List[str]) -> (str, List[Source]):
         ))
         return combined_content, sources_data
     
-    for url in urls:
-        try:
-            article = Article(url)
-            article.download()
-            article.parse()
-            if article.text:
-                combined_content += f"--- CONTENT FROM {url} ---\n{article.text}\n\n"
-                sources_data.append(Source(
-                    title=article.title,
-                    url=url,
-                    publish_date=str(article.publish_date) if article.publish_date else None,
-                    authors=article.authors
-                ))
-        except Exception as e:
-            print(f"Could not scrape {url}: {e}")
+    # Fetch every page concurrently, then parse them in parallel across the process pool
+    semaphore = app.state.scrape_semaphore
+    client = app.state.http
+    results = await asyncio.gather(*(fetch_html(client, semaphore, url) for url in urls), return_exceptions=True)
+
+    fetched = []
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            print(f"Could not scrape {url}: {result}")
+        elif result:
+            fetched.append((url, result))
+
+    loop = asyncio.get_running_loop()
+    parses = await asyncio.gather(
+        *(loop.run_in_executor(app.state.pool, parse_html, url, html, query) for url, html in fetched),
+        return_exceptions=True,
+    )
+
+    for (url, _), parsed in zip(fetched, parses):
+        if isinstance(parsed, Exception):
+            print(f"Could not parse {url}: {parsed}")
+            continue
+        title, text, authors, publish_date = parsed
+        if not text:
+            continue
+        # Hard cap on the prompt size; only sources that made it into the prompt are cited
+        header = f"--- CONTENT FROM {url} ---\n"
+        remaining = MAX_CONTENT_TOKENS * 4 - len(combined_content) - len(header) - 2
+        if remaining < min(len(text), MIN_SOURCE_CHARS):
+            print(f"Skipping {url}: prompt content budget exhausted")
+            break
+        combined_content += f"{header}{text[:remaining]}\n\n"
+        sources_data.append(Source(
+            title=title or url,
+            url=url,
+            publish_date=publish_date,
+            authors=authors
+        ))
+
+    print(f"Scraped content: ~{estimate_tokens(combined_content)} tokens from {len(sources_data)} sources")
     return combined_content, sources_data
 
-def summarize_content(content: str, query: str) -> str:
-    print("Summarizing content with Google Gemini...")
+def fallback_summary(content: str, query: str) -> Optional[str]:
+    """Returns the canned response used when there is nothing to summarize or Gemini is not configured."""
     if not content:
         return "No content was scraped to summarize."
     
@@ -191,23 +574,325 @@ Based on your query "{query}", here's what a typical response would look like:
 2. Restart the backend service
 
 *Content length: {len(content)} characters from scraped sources*"""
-    
-    prompt = f"""
-    Based on the following web content, provide a clear and comprehensive answer to the user's query.
-    Instructions:
-    1. First, provide a direct, concise summary that immediately answers the user's question.
-    2. Then, create a section with bullet points detailing the most important findings, facts, or key takeaways.
-    3. Use Markdown for formatting (e.g., **bold**, *italics*, bullet points).
-    USER QUERY: "{query}"
-    COMBINED WEB CONTENT:\n{content}
+    return None
+
+def get_summary_model() -> genai.GenerativeModel:
+    """Returns the summarization model, built once with the fixed instructions as its system instruction.
+
+    The instructions are far below Gemini's minimum size for context caching, so they are not cached server-side.
     """
+    global summary_model
+    if summary_model is None:
+        summary_model = genai.GenerativeModel(SUMMARY_MODEL_NAME, system_instruction=SUMMARY_INSTRUCTIONS)
+    return summary_model
+
+def build_summary_prompt(content: str, query: str) -> str:
+    return f'USER QUERY: "{query}"\nCOMBINED WEB CONTENT:\n{content}'
+
+def log_token_usage(response):
+    usage = response.usage_metadata
+    print(f"Gemini tokens - in: {usage.prompt_token_count}, out: {usage.candidates_token_count}")
+
+async def summarize_content(content: str, query: str) -> str:
+    print("Summarizing content with Google Gemini...")
+    fallback = fallback_summary(content, query)
+    if fallback:
+        return fallback
+    
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
+        response = await get_summary_model().generate_content_async(build_summary_prompt(content, query))
+        log_token_usage(response)
         return response.text
     except Exception as e:
         print(f"Error during summarization: {e}")
-        return "Failed to generate summary due to an AI model error."
+        return SUMMARY_ERROR_MESSAGE
+
+async def stream_summary(content: str, query: str):
+    """Yields the summary in chunks as Gemini generates it."""
+    print("Streaming summary with Google Gemini...")
+    fallback = fallback_summary(content, query)
+    if fallback:
+        yield fallback
+        return
+
+    response = await get_summary_model().generate_content_async(build_summary_prompt(content, query), stream=True)
+    async for chunk in response:
+        if chunk.text:
+            yield chunk.text
+    log_token_usage(response)
+
+def build_conversation(query: str, summary: str, sources: List[Source]) -> Conversation:
+    # One random id per conversation; message ids only need to be unique within it.
+    # Random (not time-ordered) ids keep Firestore writes spread across key ranges, avoiding hotspots.
+    convo_id = uuid.uuid4().hex
+    user_message = Message(id=f"{convo_id}-0", role="user", content=query)
+    model_message = Message(id=f"{convo_id}-1", role="model", content=summary, sources=sources)
+    return Conversation(
+        id=convo_id,
+        title=query,
+        messages=[user_message, model_message],
+        createdAt=datetime.datetime.now(datetime.timezone.utc).isoformat()
+    )
+
+async def save_conversation(convo: Conversation, cached_query: Optional[str] = None) -> bool:
+    """Persists a conversation to Firestore, optionally registering it as the exact-match answer for a query."""
+    if not db:
+        print("Warning: Database not available - conversation not persisted")
+        return False
+    try:
+        # Write the conversation and its cache entry together in a single round-trip
+        batch = db.batch()
+        batch.set(db.collection('conversations').document(convo.id), convo.model_dump(mode='json'))
+        if cached_query:
+            batch.set(db.collection('query_cache').document(query_hash(cached_query)), {"conversation_id": convo.id})
+        await batch.commit()
+        print(f"Conversation {convo.id} saved to Firestore")
+        return True
+    except Exception as e:
+        print(f"Warning: Could not save conversation to Firestore: {e}")
+        return False
+
+def query_hash(query: str) -> str:
+    """Normalized SHA-256 of a query, used as the document id for exact-match cache hits."""
+    return hashlib.sha256(query.strip().lower().encode("utf-8")).hexdigest()
+
+def is_fresh_answer(convo: Conversation) -> bool:
+    """Whether a cached conversation is young enough to be reused (QUERY_CACHE_TTL_SECONDS)."""
+    age = datetime.datetime.now(datetime.timezone.utc) - datetime.datetime.fromisoformat(convo.createdAt)
+    return age.total_seconds() < QUERY_CACHE_TTL_SECONDS
+
+async def find_cached_conversation(query: str, embedding) -> Optional[Conversation]:
+    """Looks up a previous, still fresh answer for an identical or semantically similar query.
+
+    Firestore and FAISS entries never expire themselves, so every candidate is checked against its createdAt.
+    """
+    if not db:
+        return None
+    # Each tier is guarded on its own so a Redis outage (or a Redis without the search module) still leaves the rest
+    # Exact match first: a shared Redis entry, then an O(1) document read keyed on the normalized query
+    if redis_client:
+        try:
+            cached = await redis_client.get(f"q:{query_hash(query)}")
+            if cached:
+                print("Cache hit for query in Redis")
+                return Conversation.model_validate_json(cached)
+        except Exception as e:
+            print(f"Warning: Redis response cache lookup failed: {e}")
+    candidate_ids = []
+    try:
+        exact = await db.collection('query_cache').document(query_hash(query)).get()
+        if exact.exists:
+            candidate_ids.append(exact.to_dict().get("conversation_id"))
+    except Exception as e:
+        print(f"Warning: Exact-match cache lookup failed: {e}")
+    if embedding is not None:
+        try:
+            candidate_ids.extend(await semantic_cache.lookup(embedding))
+        except Exception as e:
+            print(f"Warning: Semantic cache lookup failed: {e}")
+    try:
+        for convo_id in dict.fromkeys(filter(None, candidate_ids)):
+            doc = await db.collection('conversations').document(convo_id).get()
+            if doc.exists:
+                convo = Conversation(**doc.to_dict())
+                if is_fresh_answer(convo):
+                    print(f"Cache hit for query, reusing conversation {convo_id}")
+                    return convo
+    except Exception as e:
+        print(f"Warning: Could not load cached conversation: {e}")
+    return None
+
+async def remember_conversation(query: str, embedding, convo: Conversation):
+    """Registers a freshly generated conversation in the shared exact-match and semantic caches."""
+    if redis_client:
+        try:
+            await redis_client.set(f"q:{query_hash(query)}", convo.model_dump_json(), ex=QUERY_CACHE_TTL_SECONDS)
+        except Exception as e:
+            print(f"Warning: Could not update the Redis response cache: {e}")
+    if embedding is not None:
+        try:
+            await semantic_cache.add(embedding, convo.id)
+        except Exception as e:
+            print(f"Warning: Could not update the semantic cache: {e}")
+
+async def gather_research(query: str) -> (str, List[Source]):
+    """Searches the web and scrapes the results, raising an HTTP error when nothing usable is found."""
+    urls = await search_the_web(query)
+    if not urls:
+        raise HTTPException(status_code=404, detail="No relevant web sources found for that query.")
+    
+    content, sources = await scrape_and_process_urls(urls, query)
+    if not content:
+        raise HTTPException(status_code=500, detail="Could not extract content from any of the web sources.")
+    return content, sources
+
+async def persist_conversation(convo: Conversation, cached_query: Optional[str] = None, embedding=None):
+    """Background task: saves the conversation after the response is sent, then registers it in the caches.
+
+    A failed write is queued in Redis for retry instead of surfacing to the user.
+    """
+    if await save_conversation(convo, cached_query):
+        if cached_query:
+            await remember_conversation(cached_query, embedding, convo)
+    elif db and redis_client:
+        try:
+            payload = {"conversation": convo.model_dump(mode='json'), "cached_query": cached_query}
+            await redis_client.rpush(PERSIST_RETRY_QUEUE, orjson.dumps(payload))
+            print(f"Conversation {convo.id} queued for a retried save")
+        except redis.RedisError as e:
+            print(f"Warning: Could not queue conversation {convo.id} for retry: {e}")
+
+async def drain_persist_retries():
+    """Periodically re-saves conversations from the retry queue, stopping at the first failed save.
+
+    Malformed entries are logged and dropped so one bad payload cannot stop the loop.
+    """
+    while True:
+        await asyncio.sleep(PERSIST_RETRY_INTERVAL_SECONDS)
+        try:
+            while payload := await redis_client.lpop(PERSIST_RETRY_QUEUE):
+                try:
+                    item = orjson.loads(payload)
+                    convo = Conversation.model_validate(item["conversation"])
+                    cached_query = item.get("cached_query")
+                except Exception as e:
+                    print(f"Warning: Dropping malformed persist retry entry: {e}")
+                    continue
+                if not await save_conversation(convo, cached_query):
+                    await redis_client.lpush(PERSIST_RETRY_QUEUE, payload)
+                    break
+                if cached_query:
+                    # The embedding isn't queued; re-embedding the query puts the answer back in the semantic cache
+                    await remember_conversation(cached_query, await embed_query(cached_query), convo)
+        except redis.RedisError as e:
+            print(f"Warning: Could not drain the persist retry queue: {e}")
+        except Exception as e:
+            print(f"Warning: Persist retry pass failed: {e}")
+
+async def finish_conversation(query: str, embedding, summary: str, sources: List[Source], cacheable: bool, bg: BackgroundTasks) -> Conversation:
+    """Builds the conversation and schedules its persistence, caching the answer if it came from a real model response."""
+    new_convo = build_conversation(query, summary, sources)
+
+    # Only cache real (non-demo, non-error) answers
+    cached_query = query if google_api_key and cacheable else None
+    bg.add_task(persist_conversation, new_convo, cached_query, embedding)
+    return new_convo
+
+async def copy_conversation(query: str, source_convo: Conversation, bg: BackgroundTasks) -> Conversation:
+    """Creates a new conversation for this query that reuses the answer of an existing one."""
+    answer = source_convo.messages[-1]
+    new_convo = build_conversation(query, answer.content, answer.sources or [])
+    bg.add_task(persist_conversation, new_convo)
+    return new_convo
+
+async def reuse_cached_conversation(query: str, embedding, bg: BackgroundTasks) -> Optional[Conversation]:
+    """Answers the query from the response cache, skipping search, scraping and summarization entirely."""
+    cached_convo = await find_cached_conversation(query, embedding)
+    if not cached_convo:
+        return None
+    return await copy_conversation(query, cached_convo, bg)
+
+async def embed_query(query: str):
+    """Embeds the query off the event loop, or returns None when the semantic cache is disabled."""
+    if not semantic_cache:
+        return None
+    return await asyncio.to_thread(semantic_cache.embed, query)
+
+async def research_conversation(query: str, bg: BackgroundTasks) -> Conversation:
+    """Runs the full cache lookup, search, scrape and summarize pipeline for a query."""
+    embedding = await embed_query(query)
+    cached_convo = await reuse_cached_conversation(query, embedding, bg)
+    if cached_convo:
+        return cached_convo
+
+    # Perform the research
+    content, sources = await gather_research(query)
+    summary = await summarize_content(content, query)
+    return await finish_conversation(query, embedding, summary, sources, summary != SUMMARY_ERROR_MESSAGE, bg)
+
+inflight_requests: dict = {}
+
+async def distributed_single_flight(key: str, work) -> (Conversation, bool):
+    """Cross-worker single-flight: the worker holding `lock:{key}` runs work(), the others wait for its result.
+
+    The winner pushes the serialized outcome to `result:{key}`; each waiter pops it and pushes it back for the next.
+    """
+    lock_key, result_key = f"lock:{key}", f"result:{key}"
+    try:
+        is_winner = await redis_client.set(lock_key, WORKER_ID, nx=True, ex=SINGLE_FLIGHT_LOCK_SECONDS)
+        if is_winner:
+            await redis_client.delete(result_key)
+    except redis.RedisError as e:
+        print(f"Warning: Redis single-flight unavailable: {e}")
+        return await work(), True
+
+    if is_winner:
+        payload = None
+        try:
+            result = await work()
+            payload = result.model_dump_json()
+            return result, True
+        except HTTPException as e:
+            payload = orjson.dumps({"error": {"status_code": e.status_code, "detail": e.detail}})
+            raise
+        except Exception:
+            payload = orjson.dumps({"error": {"status_code": 500, "detail": "Research failed on another worker."}})
+            raise
+        finally:
+            try:
+                if payload is not None:
+                    await redis_client.lpush(result_key, payload)
+                    await redis_client.expire(result_key, SINGLE_FLIGHT_LOCK_SECONDS)
+                await redis_client.delete(lock_key)
+            except redis.RedisError as e:
+                print(f"Warning: Could not publish single-flight result: {e}")
+
+    try:
+        popped = await redis_client.blpop(result_key, timeout=SINGLE_FLIGHT_LOCK_SECONDS)
+        if popped is not None:
+            # Put the result back for the next waiter
+            await redis_client.lpush(result_key, popped[1])
+    except redis.RedisError as e:
+        print(f"Warning: Redis single-flight unavailable while waiting: {e}")
+        return await work(), True
+    if popped is None:
+        # The winner died or is too slow; do the work here instead of failing the request
+        return await work(), True
+    data = orjson.loads(popped[1])
+    if "error" in data:
+        raise HTTPException(**data["error"])
+    return Conversation.model_validate(data), False
+
+async def single_flight(key: str, work):
+    """Runs work() once per key; concurrent callers with the same key await that run instead of repeating it.
+
+    Duplicates are coalesced within the process and, when Redis is configured, across workers and replicas.
+    Returns (result, is_leader), where is_leader is True only for the caller that actually ran the work.
+    """
+    if key in inflight_requests:
+        return await asyncio.shield(inflight_requests[key]), False
+
+    future = asyncio.get_running_loop().create_future()
+    inflight_requests[key] = future
+    try:
+        if redis_client:
+            result, is_leader = await distributed_single_flight(key, work)
+        else:
+            result, is_leader = await work(), True
+        future.set_result(result)
+        return result, is_leader
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Mark as retrieved so an unawaited failure isn't logged
+        raise
+    finally:
+        del inflight_requests[key]
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
 
 # --- API ENDPOINTS ---
 @app.get("/health")
@@ -229,18 +914,35 @@ async def health_check():
         
     return status
 
-@app.get("/conversations", response_model=List[ConversationMeta])
-async def get_all_conversations():
-    """Retrieves metadata for all conversations."""
+# With a response_model, FastAPI serializes the result straight to JSON bytes through Pydantic
+@app.get("/conversations", response_model=ConversationPage)
+async def get_all_conversations(limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = None):
+    """Retrieves conversation metadata, newest first, one page at a time."""
     if not db:
         raise HTTPException(status_code=503, detail="Database service is not available. Please configure Firebase credentials.")
     
     try:
-        # QUICK FIX: Removed the .order_by() clause to prevent the need for a Firestore index.
-        # This gets the app working quickly. The list will not be sorted by date.
-        convs_ref = db.collection('conversations').stream()
-        convs_list = [{"id": conv.id, "title": conv.to_dict().get("title", "Untitled")} for conv in convs_ref]
-        return convs_list
+        # Ordering on a single field is served by Firestore's automatic single-field index,
+        # and only the fields needed for the sidebar are projected instead of full message histories.
+        convs_query = (
+            db.collection('conversations')
+            .select(['title', 'createdAt'])
+            .order_by('createdAt', direction=firestore.Query.DESCENDING)
+            .limit(limit)
+        )
+        if cursor:
+            convs_query = convs_query.start_after({'createdAt': cursor})
+
+        items = []
+        next_cursor = None
+        async for conv in convs_query.stream():
+            data = conv.to_dict()
+            items.append(ConversationMeta(id=conv.id, title=data.get("title", "Untitled")))
+            next_cursor = data.get("createdAt")
+        # A short page means there is nothing left to fetch
+        if len(items) < limit:
+            next_cursor = None
+        return ConversationPage(items=items, next_cursor=next_cursor)
     except Exception as e:
         print(f"Error fetching conversations: {e}")
         raise HTTPException(status_code=500, detail="Could not fetch conversations from the database.")
@@ -253,50 +955,58 @@ async def get_conversation(conversation_id: str):
         raise HTTPException(status_code=503, detail="Database service is not available. Please configure Firebase credentials.")
     
     doc_ref = db.collection('conversations').document(conversation_id)
-    doc = doc_ref.get()
+    doc = await doc_ref.get()
     if doc.exists:
-        return Conversation(**doc.to_dict())
+        return doc.to_dict()
     raise HTTPException(status_code=404, detail="Conversation not found.")
 
 @app.post("/conversations", response_model=Conversation)
-async def create_conversation(request: dict):
-    """Starts a new research conversation."""
+async def create_conversation(request: dict, bg: BackgroundTasks):
+    """Starts a new research conversation. It is saved to Firestore after the response is sent."""
     query = request.get("query")
     if not query:
         raise HTTPException(status_code=400, detail="Query is required.")
 
-    # Perform the research
-    urls = search_the_web(query)
-    if not urls:
-        raise HTTPException(status_code=404, detail="No relevant web sources found for that query.")
-    
-    content, sources = scrape_and_process_urls(urls)
-    if not content:
-        raise HTTPException(status_code=500, detail="Could not extract content from any of the web sources.")
+    # Identical queries already in flight share one pipeline run
+    convo, is_leader = await single_flight(query_hash(query), lambda: research_conversation(query, bg))
+    if not is_leader:
+        # Give this caller its own conversation rather than the other user's
+        convo = await copy_conversation(query, convo, bg)
+    return convo
 
-    summary = summarize_content(content, query)
+@app.post("/conversations/stream")
+async def stream_conversation(request: dict, bg: BackgroundTasks):
+    """Starts a new research conversation, streaming the summary as server-sent events.
 
-    # Create conversation structure
-    convo_id = str(uuid.uuid4())
-    user_message = Message(id=str(uuid.uuid4()), role="user", content=query)
-    model_message = Message(id=str(uuid.uuid4()), role="model", content=summary, sources=sources)
+    Emits `chunk` events with partial summary text, then a final `done` event with the new conversation.
+    """
+    query = request.get("query")
+    if not query:
+        raise HTTPException(status_code=400, detail="Query is required.")
 
-    new_convo = Conversation(
-        id=convo_id,
-        title=query,
-        messages=[user_message, model_message],
-        createdAt=datetime.datetime.now(datetime.timezone.utc).isoformat()
-    )
+    embedding = await embed_query(query)
+    cached_convo = await reuse_cached_conversation(query, embedding, bg)
+    if cached_convo:
+        async def cached_events():
+            yield sse_event("chunk", {"text": cached_convo.messages[-1].content})
+            yield sse_event("done", cached_convo.model_dump(mode='json'))
+        return StreamingResponse(cached_events(), media_type="text/event-stream", background=bg)
 
-    # Save to Firestore if available
-    if db:
+    content, sources = await gather_research(query)
+
+    async def summary_events():
+        parts = []
+        cacheable = True
         try:
-            db.collection('conversations').document(convo_id).set(new_convo.dict())
-            print(f"Conversation {convo_id} saved to Firestore")
+            async for text in stream_summary(content, query):
+                parts.append(text)
+                yield sse_event("chunk", {"text": text})
         except Exception as e:
-            print(f"Warning: Could not save conversation to Firestore: {e}")
-    else:
-        print("Warning: Database not available - conversation not persisted")
-    
-    return new_convo
+            print(f"Error during summarization: {e}")
+            cacheable = False
+            parts.append(SUMMARY_ERROR_MESSAGE)
+            yield sse_event("chunk", {"text": SUMMARY_ERROR_MESSAGE})
+        new_convo = await finish_conversation(query, embedding, "".join(parts), sources, cacheable, bg)
+        yield sse_event("done", new_convo.model_dump(mode='json'))
 
+    return StreamingResponse(summary_events(), media_type="text/event-stream", background=bg)
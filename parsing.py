@@ -0,0 +1,56 @@
+"""CPU-bound HTML extraction, run in the parse worker processes.
+
+Deliberately free of app state: spawned workers import only this module, not main.py.
+"""
+import re
+from typing import List, Optional
+
+import trafilatura
+from rank_bm25 import BM25Okapi
+
+SENTENCES_PER_SOURCE = 40
+SOURCE_MAX_CHARS = 8000  # About 2k tokens, so one long page can't crowd the other sources out of the prompt
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+def select_relevant_sentences(text: str, query: str, top_k: int = SENTENCES_PER_SOURCE, max_chars: int = SOURCE_MAX_CHARS) -> str:
+    """Keeps the sentences that best match the query (BM25), in their original order, up to top_k sentences and max_chars characters."""
+    sentences = [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+    if not sentences:
+        return ""
+    if len(sentences) <= top_k and len(text) <= max_chars:
+        return text
+    bm25 = BM25Okapi([sentence.lower().split() for sentence in sentences])
+    scores = bm25.get_scores(query.lower().split())
+    best, used = [], 0
+    for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+        if len(best) == top_k:
+            break
+        if used + len(sentences[i]) + 1 <= max_chars:
+            best.append(i)
+            used += len(sentences[i]) + 1
+    if not best:
+        # Text without sentence punctuation (lists, tables, run-ons) can be one oversized "sentence"
+        return text[:max_chars]
+    return " ".join(sentences[i] for i in sorted(best))
+
+
+def parse_html(url: str, html: str, query: str) -> (Optional[str], str, List[str], Optional[str]):
+    """Extracts (title, text, authors, publish_date) from a downloaded page; text is empty if nothing was found.
+
+    Only the sentences most relevant to the query are kept, to cut the tokens sent to Gemini.
+    """
+    # One pass for text and metadata; the metadata extractor already falls back to <title>
+    document = trafilatura.bare_extraction(html, url=url, include_comments=False, favor_precision=True, with_metadata=True)
+    if document is None:
+        return None, "", [], None
+    if not isinstance(document, dict):
+        # Newer trafilatura releases may return a Document instead of a dict
+        document = document.as_dict()
+    text = document.get("text")
+    if not text:
+        return None, "", [], None
+    text = select_relevant_sentences(text, query)
+    author = document.get("author")
+    authors = [a.strip() for a in author.split(';')] if author else []
+    return document.get("title"), text, authors, document.get("date")
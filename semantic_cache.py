@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import threading
+from typing import List, Optional
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+REDIS_INDEX_NAME = "semantic_idx"
+REDIS_KEY_PREFIX = "emb:"
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+PERSIST_DELAY_SECONDS = 5  # Additions within this window are written to disk together
+LOOKUP_CANDIDATES = 5  # Neighbours returned per lookup, so a stale best match doesn't hide a fresh one
+
+
+def _cpu_flags() -> set:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def load_embedder(model_name: str = DEFAULT_MODEL_NAME) -> SentenceTransformer:
+    """Loads the embedding model on ONNX Runtime: CUDA when a GPU is available, otherwise an INT8-quantized CPU build.
+
+    Falls back to the PyTorch backend if ONNX Runtime (sentence-transformers[onnx]) is not installed.
+    """
+    try:
+        import onnxruntime
+
+        if "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+            return SentenceTransformer(model_name, backend="onnx", model_kwargs={"provider": "CUDAExecutionProvider"})
+
+        # The model repo ships dynamically quantized INT8 exports tuned per instruction set
+        flags = _cpu_flags()
+        if "avx512_vnni" in flags:
+            file_name = "onnx/model_qint8_avx512_vnni.onnx"
+        elif "avx512f" in flags:
+            file_name = "onnx/model_qint8_avx512.onnx"
+        elif "avx2" in flags:
+            file_name = "onnx/model_qint8_avx2.onnx"
+        else:
+            file_name = "onnx/model.onnx"
+        return SentenceTransformer(
+            model_name,
+            backend="onnx",
+            model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider"},
+        )
+    except Exception as e:
+        print(f"ONNX Runtime embedder unavailable, using PyTorch instead: {e}")
+        return SentenceTransformer(model_name)
+
+
+class SemanticCache:
+    """Maps query embeddings to the conversation that answered them.
+
+    Vectors live in an in-memory FAISS index persisted to disk, or, when a Redis client is given,
+    in a Redis Stack HNSW vector index so every worker and replica shares the same cache.
+    """
+
+    def __init__(self, index_path: str, embedder: SentenceTransformer, score_threshold: float = 0.90, redis_client=None, redis_ttl_seconds: Optional[int] = None):
+        self.index_path = index_path
+        self.ids_path = f"{index_path}.ids.json"
+        self.score_threshold = score_threshold
+        self.model = embedder
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.redis = redis_client
+        self.redis_ttl_seconds = redis_ttl_seconds
+        self.redis_index_ready = False
+        self.persist_task = None
+        # Guards the in-memory index while a worker thread snapshots it for writing
+        self.index_lock = threading.Lock()
+
+        if self.redis is not None:
+            return
+        self.index, self.convo_ids = self._load()
+
+    def _load(self):
+        if os.path.exists(self.index_path) and os.path.exists(self.ids_path):
+            index = faiss.read_index(self.index_path)
+            with open(self.ids_path) as f:
+                convo_ids = json.load(f)
+            # Both files are append-only and the ids are written first, so the ids file may only ever
+            # be ahead of the index; anything else means the pair is corrupt and is discarded.
+            if len(convo_ids) >= index.ntotal:
+                return index, convo_ids[:index.ntotal]
+            print("⚠️  Semantic cache files are inconsistent, starting with an empty index")
+        # Inner product over normalized vectors is cosine similarity
+        return faiss.IndexFlatIP(self.dimension), []
+
+    def embed(self, query: str) -> np.ndarray:
+        embedding = self.model.encode([query.strip()], normalize_embeddings=True)
+        return np.asarray(embedding, dtype="float32")
+
+    async def lookup(self, embedding: np.ndarray) -> List[str]:
+        """Returns the conversation ids of the closest cached queries that are similar enough, best first."""
+        if self.redis is not None:
+            return await self._redis_lookup(embedding)
+        if self.index.ntotal == 0:
+            return []
+        scores, indices = self.index.search(embedding, min(LOOKUP_CANDIDATES, self.index.ntotal))
+        return [self.convo_ids[i] for score, i in zip(scores[0], indices[0]) if i >= 0 and score >= self.score_threshold]
+
+    async def add(self, embedding: np.ndarray, convo_id: str) -> None:
+        if self.redis is not None:
+            await self._ensure_redis_index()
+            key = f"{REDIS_KEY_PREFIX}{convo_id}"
+            await self.redis.hset(key, mapping={"convo_id": convo_id, "embedding": embedding[0].tobytes()})
+            if self.redis_ttl_seconds:
+                # Expired hashes drop out of the vector index automatically
+                await self.redis.expire(key, self.redis_ttl_seconds)
+            return
+        with self.index_lock:
+            self.index.add(embedding)
+            self.convo_ids.append(convo_id)
+        # Debounced: one write covers every addition made while it was pending
+        if self.persist_task is None:
+            self.persist_task = asyncio.create_task(self._persist_later())
+
+    async def _persist_later(self) -> None:
+        try:
+            await asyncio.sleep(PERSIST_DELAY_SECONDS)
+        finally:
+            self.persist_task = None
+            await asyncio.to_thread(self.persist)
+
+    async def flush(self) -> None:
+        """Writes any pending additions to disk immediately, e.g. on shutdown."""
+        if self.persist_task is not None:
+            self.persist_task.cancel()
+            try:
+                await self.persist_task
+            except asyncio.CancelledError:
+                pass
+
+    def persist(self) -> None:
+        """Atomically replaces the index and ids files with a snapshot of the in-memory state."""
+        with self.index_lock:
+            index_bytes = faiss.serialize_index(self.index)
+            convo_ids = list(self.convo_ids)
+        # The ids go first so a crash between the two replaces leaves ids ahead of the index, which _load tolerates
+        self._write_atomically(self.ids_path, json.dumps(convo_ids).encode("utf-8"))
+        self._write_atomically(self.index_path, index_bytes.tobytes())
+
+    @staticmethod
+    def _write_atomically(path: str, data: bytes) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    async def _ensure_redis_index(self) -> None:
+        if self.redis_index_ready:
+            return
+        try:
+            await self.redis.execute_command(
+                "FT.CREATE", REDIS_INDEX_NAME, "ON", "HASH", "PREFIX", 1, REDIS_KEY_PREFIX,
+                "SCHEMA", "convo_id", "TAG",
+                "embedding", "VECTOR", "HNSW", 6, "TYPE", "FLOAT32", "DIM", self.dimension, "DISTANCE_METRIC", "COSINE",
+            )
+        except Exception as e:
+            if "already exists" not in str(e).lower():
+                raise
+        self.redis_index_ready = True
+
+    async def _redis_lookup(self, embedding: np.ndarray) -> List[str]:
+        await self._ensure_redis_index()
+        result = await self.redis.execute_command(
+            "FT.SEARCH", REDIS_INDEX_NAME, f"*=>[KNN {LOOKUP_CANDIDATES} @embedding $vec AS score]",
+            "PARAMS", 2, "vec", embedding[0].tobytes(),
+            "SORTBY", "score",
+            "RETURN", 2, "convo_id", "score",
+            "LIMIT", 0, LOOKUP_CANDIDATES,
+            "DIALECT", 2,
+        )
+        # Reply layout: [total, key, [field, value, ...], key, [...], ...]
+        convo_ids = []
+        for raw_fields in (result[2::2] if result else []):
+            fields = dict(zip(raw_fields[::2], raw_fields[1::2]))
+            # Redis reports cosine distance, so similarity is 1 - distance
+            if 1 - float(fields[b"score"]) >= self.score_threshold:
+                convo_ids.append(fields[b"convo_id"].decode())
+        return convo_ids
@@ -0,0 +1,22 @@
+"""Production launcher: one uvicorn worker per core on uvloop and httptools.
+
+Kept separate from main.py so the supervisor process doesn't import the app (and initialize Firebase,
+the embedder, etc.) before spawning workers that each import it again.
+"""
+import os
+
+import uvicorn
+
+if __name__ == "__main__":
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    # Workers inherit this, so the app can size per-worker resources and detect multi-worker mode
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        access_log=False,
+    )